@@ -4,6 +4,7 @@ from dataclasses import dataclass
 from utils import what_day, df_to_csv
 from constraints import NurseConstraintLibrary
 from typing import Callable, Any
+import inspect
 
 
 @dataclass
@@ -34,13 +35,22 @@ class NurseSchedulingModel:
             for day in self.all_days
         }
 
-        self.applied_constraints = {}
+        self.applied_constraints: list[tuple[Callable, dict[str, Any]]] = []
 
-    def add_constraints(self, description: str, constraint_func, **params: Any):
-        self.applied_constraints[description] = (constraint_func, params)
+    def add_constraints(self, description: str, constraint_func: Callable,
+                        **params: Any):
+        try:
+            inspect.signature(constraint_func).bind(
+                self.model, self.shifts, self.nurses,
+                self.all_days, self.daily_shifts, **params)
+        except TypeError as e:
+            raise TypeError(f"Invalid parameters for '{description}': "
+                            f"{str(e)}") from e
+
+        self.applied_constraints.append((constraint_func, params))
 
     def apply_constraints(self):
-        for constraint_func, params in self.applied_constraints.values():
+        for constraint_func, params in self.applied_constraints:
             constraint_func(
                 self.model, self.shifts, self.nurses,
                 self.all_days, self.daily_shifts, **params)
@@ -136,11 +146,9 @@ class RosterStatistics:
                                          'Shift']).size().unstack(fill_value=0)
         shift_counts = shift_counts.rename(columns=shift_labels)
 
-        summary = solution.groupby('Nurse').apply(
-            lambda x: pd.Series({
-                'Weekday Shifts': x.loc[~x['Weekend'], 'Shift'].count(),
-                'Weekend Shifts': x.loc[x['Weekend'], 'Shift'].count()
-            }))
+        summary = pd.crosstab(solution['Nurse'], solution['Weekend'])
+        summary = summary.reindex(columns=[False, True], fill_value=0)
+        summary.columns = ['Weekday Shifts', 'Weekend Shifts']
 
         summary = summary.join(shift_counts)
         summary['Total Shifts'] = summary[['Weekday Shifts',
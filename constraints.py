@@ -1,30 +1,41 @@
 from ortools.sat.python import cp_model
-import pandas as pd
-from utils import what_day
+from utils import DAYS_OF_WEEK
 
 
 class NurseConstraintLibrary:
     @staticmethod
     def limit_shifts_per_period(model: cp_model.CpModel, shifts: dict,
-                                nurses: pd.DataFrame, days: range,
+                                nurse_ids: list[int], days: range,
                                 daily_shifts: dict[int, str],
                                 period_length: int, shift_limit: int
                                 ) -> cp_model.CpModel:
 
         """Constraint: Each nurse works at most shift_limit
-                       shift per period_length."""
+                       shift per period_length.
+
+        A shift_limit of 1 is posted as AddAtMostOne, which CP-SAT
+        propagates as a native Boolean constraint rather than a linear sum.
+        Periods with no more shifts than shift_limit are skipped.
+        """
 
         for period in days[::period_length]:
             period_days = range(period, min(period + period_length, len(days)))
-            for nurse in nurses['Nurse']:
-                model.Add(sum(shifts[(nurse, day, shift)]
-                              for day in period_days
-                              for shift in daily_shifts) <= shift_limit)
+            for nurse in nurse_ids:
+                period_shifts = [shifts[(nurse, day, shift)]
+                                 for day in period_days
+                                 for shift in daily_shifts]
+                if len(period_shifts) <= shift_limit:
+                    continue
+                if shift_limit == 1:
+                    model.AddAtMostOne(period_shifts)
+                else:
+                    model.Add(cp_model.LinearExpr.Sum(period_shifts) <=
+                              shift_limit)
         return model
 
     @staticmethod
     def single_nurse_per_shift(model: cp_model.CpModel, shifts:
-                               dict, nurses: pd.DataFrame, days: range,
+                               dict, nurse_ids: list[int], days: range,
                                daily_shifts: dict[int, str]
                                ) -> cp_model.CpModel:
 
@@ -32,149 +43,225 @@ class NurseConstraintLibrary:
         for day in days:
             for shift in daily_shifts:
                 model.AddExactlyOne(shifts[(nurse, day, shift)]
-                                    for nurse in nurses['Nurse'])
+                                    for nurse in nurse_ids)
         return model
 
     @staticmethod
     def limit_nurse_per_team_per_day(model: cp_model.CpModel, shifts: dict,
-                                     nurses: pd.DataFrame, days: range,
+                                     teams: dict[str, list[int]], days: range,
                                      daily_shifts: dict[int, str],
                                      nurse_limit: int = 1) -> cp_model.CpModel:
 
         """Constraint: Limit the number of nurses from the
                        same team working each day to nurse_limit."""
         for day in days:
-            for _, group in nurses.groupby('Team'):
-                model.Add(sum(shifts[(nurse, day, shift)]
-                              for nurse in group['Nurse']
-                              for shift in daily_shifts) <= nurse_limit)
+            for team_nurses in teams.values():
+                team_shifts = [shifts[(nurse, day, shift)]
+                               for nurse in team_nurses
+                               for shift in daily_shifts]
+                if nurse_limit == 1:
+                    model.AddAtMostOne(team_shifts)
+                else:
+                    model.Add(cp_model.LinearExpr.Sum(team_shifts) <=
+                              nurse_limit)
         return model
 
     @staticmethod
-    def distribute_shifts_evenly(model: cp_model.CpModel, shifts: dict,
-                                 nurses: pd.DataFrame, days,
-                                 daily_shifts: dict[int, str],
-                                 num_nurses: int, tolerance: int
-                                 ) -> cp_model.CpModel:
+    def break_team_symmetry(model: cp_model.CpModel, shifts: dict,
+                            teams: dict[str, list[int]], days: range,
+                            daily_shifts: dict[int, str]) -> cp_model.CpModel:
+
+        """Constraint: Order the nurses of each team by shifts worked.
+
+        Nurses in the same team are interchangeable under every other
+        constraint, so fixing their order only removes permutations of the
+        same roster from the search. It also means a lower-id nurse never
+        works more shifts than the next nurse of their team.
+        """
+        for team_nurses in teams.values():
+            team_nurses = sorted(team_nurses)
+            for nurse, next_nurse in zip(team_nurses, team_nurses[1:]):
+                model.Add(cp_model.LinearExpr.Sum(
+                    [shifts[(nurse, day, shift)]
+                     for day in days for shift in daily_shifts]) <=
+                    cp_model.LinearExpr.Sum(
+                    [shifts[(next_nurse, day, shift)]
+                     for day in days for shift in daily_shifts]))
+        return model
 
-        """Constraint: Shifts are distributed evenly
-                       among nurses across days."""
-        num_days = len(days)
-        num_shifts = len(daily_shifts)
+    @staticmethod
+    def even_shift_bounds(num_days: int, num_shifts: int, num_nurses: int,
+                          tolerance: int) -> tuple[int, int]:
 
+        """Helper: Minimum and maximum shifts per nurse allowed
+                  by distribute_shifts_evenly.
+        """
         min_shifts_per_nurse = (num_shifts * num_days) // num_nurses
         if (num_shifts * num_days) % num_nurses == 0:
             max_shifts_per_nurse = min_shifts_per_nurse
         else:
             max_shifts_per_nurse = min_shifts_per_nurse + tolerance
 
-        for nurse in nurses['Nurse']:
-            num_shifts_worked = sum(shifts[(nurse, day, shift)]
-                                    for day in days
-                                    for shift in daily_shifts)
-            model.Add(num_shifts_worked >= min_shifts_per_nurse)
-            model.Add(num_shifts_worked <= max_shifts_per_nurse)
+        return min_shifts_per_nurse, max_shifts_per_nurse
+
+    @staticmethod
+    def distribute_shifts_evenly(model: cp_model.CpModel, shifts: dict,
+                                 nurse_ids: list[int], days,
+                                 daily_shifts: dict[int, str],
+                                 num_nurses: int, tolerance: int
+                                 ) -> cp_model.CpModel:
+
+        """Constraint: Shifts are distributed evenly
+                       among nurses across days."""
+        min_shifts_per_nurse, max_shifts_per_nurse = \
+            NurseConstraintLibrary.even_shift_bounds(
+                len(days), len(daily_shifts), num_nurses, tolerance)
+
+        for nurse in nurse_ids:
+            num_shifts_worked = cp_model.LinearExpr.Sum(
+                [shifts[(nurse, day, shift)]
+                 for day in days for shift in daily_shifts])
+            model.AddLinearConstraint(num_shifts_worked,
+                                      min_shifts_per_nurse,
+                                      max_shifts_per_nurse)
         return model
 
     @staticmethod
     def max_shifts_per_week(model: cp_model.CpModel, shifts: dict,
-                            nurses: pd.DataFrame, days: range,
+                            nurse_ids: list[int], days: range,
                             daily_shifts: dict[int, str], num_days: int,
                             shift_limit: int = 4) -> cp_model.CpModel:
 
         """Constraint: Maximum number of shifts per week."""
         for week_start in days[::7]:
-            for nurse in nurses['Nurse']:
+            for nurse in nurse_ids:
                 week_days = range(week_start, min(week_start + 7, num_days))
-                model.Add(sum(shifts[(nurse, day, shift)]
-                              for day in week_days
-                              for shift in daily_shifts) <= shift_limit)
+                week_shifts = [shifts[(nurse, day, shift)]
+                               for day in week_days
+                               for shift in daily_shifts]
+                if len(week_shifts) <= shift_limit:
+                    continue
+                if shift_limit == 1:
+                    model.AddAtMostOne(week_shifts)
+                else:
+                    model.Add(cp_model.LinearExpr.Sum(week_shifts) <=
+                              shift_limit)
         return model
 
     @staticmethod
     def limit_consecutive_shifts(model: cp_model.CpModel, shifts: dict,
-                                 nurses: pd.DataFrame, days: range,
+                                 nurse_ids: list[int], days: range,
                                  num_days: int, limited_shifts: list[int],
                                  num_consecutive: int) -> cp_model.CpModel:
 
-        """Constraint: Limit consecutive shifts of the same type."""
-        for day in days:
-            for nurse in nurses['Nurse']:
-                max_consecutive_days = min(num_consecutive, num_days - day)
+        """Constraint: Limit consecutive shifts of the same type.
+
+        Only full-length windows are posted; the shorter windows at the end
+        of the schedule are contained in the last full one.
+        """
+        window_length = min(num_consecutive, num_days)
+        for day in days[:num_days - window_length + 1]:
+            for nurse in nurse_ids:
                 model.AddAtMostOne(
                     shifts[(nurse, day + offset, shift)]
-                    for offset in range(max_consecutive_days)
+                    for offset in range(window_length)
                     for shift in limited_shifts)
         return model
 
     @staticmethod
     def limit_shifts_after_shifts(model: cp_model.CpModel, shifts: dict,
-                                  nurses: pd.DataFrame, days: range,
+                                  nurse_ids: list[int], days: range,
                                   first_shifts: list[int],
                                   limited_shifts: list[int],
                                   num_consecutive: int, allowed_num_shifts: int
                                   ) -> cp_model.CpModel:
 
         """Constraint: Limit limited_shifts for num_consecutive days to
-                       allowed_num_shifts if first_shifts are worked."""
-        for day in days:
-            for nurse in nurses['Nurse']:
-                worked_shifts_first = model.NewBoolVar(
-                    f'worked_shift_n{nurse}_d{day}')
-
-                model.AddMaxEquality(worked_shifts_first,
-                                     [shifts[(nurse, day, shift)]
-                                      for shift in first_shifts])
+                       allowed_num_shifts if first_shifts are worked.
 
+        The first_shifts literals are used directly as the enforcement
+        literals when allowed_num_shifts is 0 or there is a single first
+        shift, so an indicator variable is only created otherwise.
+        """
+        for day in days:
+            for nurse in nurse_ids:
+                first_day_shifts = [shifts[(nurse, day, shift)]
+                                    for shift in first_shifts]
                 max_consecutive_days = min(num_consecutive, len(days) - day)
-                model.Add(sum(
-                    shifts[(nurse, day + offset, shift)]
-                    for offset in range(max_consecutive_days)
-                    for shift in limited_shifts) == allowed_num_shifts
-                          ).OnlyEnforceIf(worked_shifts_first)
+                window_shifts = [shifts[(nurse, day + offset, shift)]
+                                 for offset in range(max_consecutive_days)
+                                 for shift in limited_shifts]
+
+                if allowed_num_shifts == 0:
+                    for first_shift in first_day_shifts:
+                        model.AddBoolAnd(
+                            [shift.Not() for shift in window_shifts]
+                        ).OnlyEnforceIf(first_shift)
+                    continue
+
+                if len(first_day_shifts) == 1:
+                    worked_shifts_first = first_day_shifts[0]
+                else:
+                    worked_shifts_first = model.NewBoolVar('')
+                    model.AddBoolOr(first_day_shifts).OnlyEnforceIf(
+                        worked_shifts_first)
+                    model.AddBoolAnd(
+                        [shift.Not() for shift in first_day_shifts]
+                    ).OnlyEnforceIf(worked_shifts_first.Not())
+
+                model.Add(cp_model.LinearExpr.Sum(window_shifts) ==
+                          allowed_num_shifts).OnlyEnforceIf(
+                              worked_shifts_first)
         return model
 
     @staticmethod
     def assign_consecutive_shifts(model: cp_model.CpModel, shifts: dict,
-                                  rest_days: dict, nurses: pd.DataFrame,
+                                  rest_days: dict, nurse_ids: list[int],
                                   days: range, daily_shifts: dict[int, str],
-                                  start_day: str, num_days: int,
-                                  start_shift_day: str, shift_index: int,
+                                  day_info: list[tuple[str, bool]],
+                                  num_days: int, start_shift_day: str,
+                                  shift_index: int,
                                   num_consecutive: int) -> cp_model.CpModel:
 
         """Constraint: Assign consecutive shifts for a given shift type
-                       starting on a specific day."""
-        for day in days:
-            day_name = what_day(day, start_day)[0]
-            for nurse in nurses['Nurse']:
-                if day_name == start_shift_day:
-                    worked_consecutive_shifts = model.NewBoolVar(
-                        f'worked_shift_n{nurse}_d{day}')
-                    model.Add(
-                        worked_consecutive_shifts ==
-                        shifts[nurse, day, shift_index])
-
-                    for day_offset in range(1, num_consecutive):
-                        shift_day_index = day + day_offset
-                        if shift_day_index < num_days:
-                            model.Add(shifts[nurse, shift_day_index, shift_index] ==
-                                      shifts[nurse, day, shift_index])
-
-                    rest_start_day = day + num_consecutive
-                    for rest_offset in range(2):
-                        rest_day_index = rest_start_day + rest_offset
-                        if rest_day_index < num_days:
-                            model.Add(sum(shifts[nurse, rest_day_index, shift]
-                                      for shift in daily_shifts) == 0
-                                      ).OnlyEnforceIf(worked_consecutive_shifts)
-                            model.Add(rest_days[nurse, rest_day_index] ==
-                                      worked_consecutive_shifts)
+                       starting on a specific day.
+
+        The two days after each block are recorded in rest_days as the
+        block's own start literal, so no extra variables are created.
+        """
+        first_start_day = (DAYS_OF_WEEK.index(start_shift_day) -
+                           DAYS_OF_WEEK.index(day_info[days[0]][0])) % 7
+        for day in days[first_start_day::7]:
+            shift_window = range(day + 1, min(day + num_consecutive, num_days))
+            rest_window = range(day + num_consecutive,
+                                min(day + num_consecutive + 2, num_days))
+            for nurse in nurse_ids:
+                worked_consecutive_shifts = shifts[nurse, day, shift_index]
+
+                consecutive_shifts = [shifts[nurse, shift_day, shift_index]
+                                      for shift_day in shift_window]
+                model.AddBoolAnd(consecutive_shifts).OnlyEnforceIf(
+                    worked_consecutive_shifts)
+                model.AddBoolAnd(
+                    [shift.Not() for shift in consecutive_shifts]
+                ).OnlyEnforceIf(worked_consecutive_shifts.Not())
+
+                model.AddBoolAnd(
+                    [shifts[nurse, rest_day, shift].Not()
+                     for rest_day in rest_window for shift in daily_shifts]
+                ).OnlyEnforceIf(worked_consecutive_shifts)
+                for rest_day in rest_window:
+                    if (nurse, rest_day) in rest_days:
+                        model.Add(rest_days[nurse, rest_day] ==
+                                  worked_consecutive_shifts)
+                    else:
+                        rest_days[nurse, rest_day] = worked_consecutive_shifts
 
         return model
 
     @staticmethod
     def distribute_night_shifts_evenly(model: cp_model.CpModel, shifts: dict,
-                                       nurses: pd.DataFrame, days: range,
+                                       nurse_ids: list[int], days: range,
                                        num_nurses: int, shift_index: int
                                        ) -> cp_model.CpModel:
 
@@ -202,10 +289,11 @@ class NurseConstraintLibrary:
         else:
             max_shifts_per_nurse = min_shifts_per_nurse + 4
 
-        for nurse in nurses['Nurse']:
-            num_shifts_worked = sum(shifts[(nurse, day, shift_index)]
-                                    for day in days)
-            model.Add(num_shifts_worked >= min_shifts_per_nurse)
-            model.Add(num_shifts_worked <= max_shifts_per_nurse)
+        for nurse in nurse_ids:
+            num_shifts_worked = cp_model.LinearExpr.Sum(
+                [shifts[(nurse, day, shift_index)] for day in days])
+            model.AddLinearConstraint(num_shifts_worked,
+                                      min_shifts_per_nurse,
+                                      max_shifts_per_nurse)
 
         return model
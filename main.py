@@ -3,20 +3,23 @@ import os
 from utils import csv_to_df
 from scheduler import NurseSchedulingModel
 
+_HERE = os.path.dirname(__file__)
+
+DAILY_SHIFTS = {
+    0: 'ED Day 01',
+    1: 'ED Day 02',
+    2: 'ED Nights',
+}
+
 
 def main() -> None:
-    file_path = os.path.join(os.path.dirname(__file__), 'Nurses.csv')
+    file_path = os.path.join(_HERE, 'Nurses.csv')
     nurses = csv_to_df(file_path)
 
-    daily_shifts = {
-        0: 'ED Day 01',
-        1: 'ED Day 02',
-        2: 'ED Nights',
-    }
     num_days = 56
 
     nurse_scheduler = NurseSchedulingModel(
-        nurses, daily_shifts,
+        nurses, DAILY_SHIFTS,
         num_days, start_day='Monday')
 
     nurse_scheduler.add_constraints()
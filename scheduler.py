@@ -1,10 +1,16 @@
 from ortools.sat.python import cp_model
+import numpy as np
 import pandas as pd
 from dataclasses import dataclass
-from utils import what_day, df_to_csv
+from utils import DAYS_OF_WEEK, what_day, df_to_csv
 from constraints import NurseConstraintLibrary
+from itertools import product, repeat
+from concurrent.futures import ThreadPoolExecutor
 import os
 
+_HERE = os.path.dirname(__file__)
+_IO_WORKERS = min(16, os.cpu_count() or 1)
+
 
 @dataclass
 class NurseSchedulingModel:
@@ -12,136 +18,187 @@ class NurseSchedulingModel:
     daily_shifts: dict[int, str]
     num_days: int
     start_day: str = 'Monday'
+    debug: bool = False
 
     def __post_init__(self):
         self.all_days = range(self.num_days)
+        self.day_info = [what_day(day, self.start_day)
+                         for day in self.all_days]
+        self.weekend_mask = np.array([is_weekend for _, is_weekend
+                                      in self.day_info], dtype=bool)
+        self.weekend_days = tuple(
+            np.flatnonzero(self.weekend_mask).tolist())
+        self.weekday_days = tuple(
+            np.flatnonzero(~self.weekend_mask).tolist())
         self.num_nurses = len(self.nurses)
+        self.nurse_ids = self.nurses['Nurse'].tolist()
+        self.shift_ids = tuple(self.daily_shifts)
+        self.teams = {team: group['Nurse'].tolist()
+                      for team, group in self.nurses.groupby('Team')}
 
         self.model = cp_model.CpModel()
 
-        self.shifts = {
-            (nurse, day, shift): self.model.NewBoolVar(
-                f'shift_n{nurse}_d{day}_s{shift}')
-            for nurse in self.nurses['Nurse']
-            for day in self.all_days
-            for shift in self.daily_shifts
-        }
-
-        self.rest_days = {
-            (nurse, day): self.model.NewBoolVar(
-                f'rest_n{nurse}_d{day}')
-            for nurse in self.nurses['Nurse']
-            for day in self.all_days
-        }
-
-    def add_constraints(self):
+        shift_keys = list(product(self.nurse_ids, self.all_days,
+                                  self.shift_ids))
+        if self.debug:
+            shift_names = [f'shift_n{nurse}_d{day}_s{shift}'
+                           for nurse, day, shift in shift_keys]
+        else:
+            shift_names = repeat('', len(shift_keys))
+
+        shifts_shape = (self.num_nurses, self.num_days, len(self.shift_ids))
+        self.shifts_arr = np.array(
+            [self.model.NewBoolVar(name) for name in shift_names],
+            dtype=object).reshape(shifts_shape)
+        self.shifts = dict(zip(shift_keys, self.shifts_arr.flat))
+
+        self.rest_days = {}
+
+    def add_constraints(self, break_symmetry: bool = False):
         ncl = NurseConstraintLibrary
 
         # Constraint 1: Each nurse works at most one shift per day
         ncl.limit_shifts_per_period(
-            self.model, self.shifts, self.nurses, self.all_days,
+            self.model, self.shifts, self.nurse_ids, self.all_days,
             self.daily_shifts, period_length=1, shift_limit=1)
 
         # Constraint 2: Each shift is assigned to a single nurse per day
         ncl.single_nurse_per_shift(
-            self.model, self.shifts, self.nurses, self.all_days,
+            self.model, self.shifts, self.nurse_ids, self.all_days,
             self.daily_shifts)
 
         # Constraint 3: Same nurse works ED Nights Mon-Wed,
         # with Thursday & Friday as Rest Day
         ncl.assign_consecutive_shifts(
-            self.model, self.shifts, self.rest_days, self.nurses,
-            self.all_days, self.daily_shifts, self.start_day,
+            self.model, self.shifts, self.rest_days, self.nurse_ids,
+            self.all_days, self.daily_shifts, self.day_info,
             self.num_days, start_shift_day='Monday', shift_index=2,
             num_consecutive=3)
 
         # Constraint 4: Same nurse works ED Nights Thurs-Sun,
         # with Monday & Tuesday as Rest Day
         ncl.assign_consecutive_shifts(
-            self.model, self.shifts, self.rest_days, self.nurses,
-            self.all_days, self.daily_shifts, self.start_day,
+            self.model, self.shifts, self.rest_days, self.nurse_ids,
+            self.all_days, self.daily_shifts, self.day_info,
             self.num_days, start_shift_day='Thursday', shift_index=2,
             num_consecutive=4)
 
         # Constraint 5: Divide ED Day 01 shifts evenly
         ncl.distribute_shifts_evenly(
-            self.model, self.shifts, self.nurses, self.all_days,
+            self.model, self.shifts, self.nurse_ids, self.all_days,
             {0: 'ED Day 01'}, self.num_nurses, tolerance=1)
 
         # Constraint 6: Divide ED Night shifts evenly
         ncl.distribute_night_shifts_evenly(
-            self.model, self.shifts, self.nurses, self.all_days,
+            self.model, self.shifts, self.nurse_ids, self.all_days,
             self.num_nurses, shift_index=2)
 
-        # Constraint 7: Divide total shifts evenly
-        ncl.distribute_shifts_evenly(
-            self.model, self.shifts, self.nurses, self.all_days,
-            self.daily_shifts, self.num_nurses, tolerance=1)
+        # Constraint 7: Divide total shifts evenly. Skipped when the
+        # weekend and weekday bounds of Constraints 8 & 9 already imply it
+        num_shifts = len(self.daily_shifts)
+        total_bounds = ncl.even_shift_bounds(
+            self.num_days, num_shifts, self.num_nurses, tolerance=1)
+        split_bounds = [ncl.even_shift_bounds(
+            len(days), num_shifts, self.num_nurses, tolerance=1)
+            for days in (self.weekend_days, self.weekday_days)]
+        if (sum(low for low, _ in split_bounds) < total_bounds[0] or
+                sum(high for _, high in split_bounds) > total_bounds[1]):
+            ncl.distribute_shifts_evenly(
+                self.model, self.shifts, self.nurse_ids, self.all_days,
+                self.daily_shifts, self.num_nurses, tolerance=1)
 
         # Constraint 8: Divide Weekend On Call shifts evenly
-        weekend_days = [day for day in self.all_days
-                        if what_day(day, self.start_day)[1]]
         ncl.distribute_shifts_evenly(
-            self.model, self.shifts, self.nurses, weekend_days,
+            self.model, self.shifts, self.nurse_ids, self.weekend_days,
             self.daily_shifts, self.num_nurses, tolerance=1)
 
         # Constraint 9: Divide Weekday On Call shifts evenly
-        weekday_days = [day for day in self.all_days
-                        if not what_day(day, self.start_day)[1]]
         ncl.distribute_shifts_evenly(
-            self.model, self.shifts, self.nurses, weekday_days,
+            self.model, self.shifts, self.nurse_ids, self.weekday_days,
             self.daily_shifts, self.num_nurses, tolerance=1)
 
         # Constraint 10: Can't have two consecutive On Call Day shifts
         ncl.limit_consecutive_shifts(
-            self.model, self.shifts, self.nurses, self.all_days,
+            self.model, self.shifts, self.nurse_ids, self.all_days,
             self.num_days, limited_shifts=[0, 1], num_consecutive=2)
 
         # Constraint 11: Each nurse has max 4 On Call shifts a week
         ncl.limit_shifts_per_period(
-            self.model, self.shifts, self.nurses, self.all_days,
+            self.model, self.shifts, self.nurse_ids, self.all_days,
             self.daily_shifts, period_length=7, shift_limit=4)
 
         # Constraint 12: Can't do ED Nights the day after On Call Day Shift
         ncl.limit_shifts_after_shifts(
-            self.model, self.shifts, self.nurses, self.all_days,
+            self.model, self.shifts, self.nurse_ids, self.all_days,
             first_shifts=[0, 1], limited_shifts=[2], num_consecutive=2,
             allowed_num_shifts=0)
 
         # Constraint 13: Only one nurse from each team works each day
         ncl.limit_nurse_per_team_per_day(
-            self.model, self.shifts, self.nurses, self.all_days,
+            self.model, self.shifts, self.teams, self.all_days,
             self.daily_shifts, nurse_limit=1)
 
-    def solve(self) -> None:
+        # Optional symmetry breaking: order interchangeable nurses within
+        # each team. Mainly useful with few search workers
+        if break_symmetry:
+            ncl.break_team_symmetry(
+                self.model, self.shifts, self.teams, self.all_days,
+                self.daily_shifts)
+
+    def solve(self, num_search_workers: int = 16,
+              log_search_progress: bool = False,
+              linearization_level: int = 1,
+              cp_model_probing_level: int = 2,
+              symmetry_level: int = 2,
+              max_time_in_seconds: float = None) -> None:
         solver = cp_model.CpSolver()
+        solver.parameters.num_search_workers = num_search_workers
+        solver.parameters.log_search_progress = log_search_progress
+        solver.parameters.linearization_level = linearization_level
+        solver.parameters.cp_model_probing_level = cp_model_probing_level
+        solver.parameters.symmetry_level = symmetry_level
+        if max_time_in_seconds is not None:
+            solver.parameters.max_time_in_seconds = max_time_in_seconds
+        solver.parameters.stop_after_first_solution = \
+            not self.model.HasObjective()
         status = solver.Solve(self.model)
 
-        if status == cp_model.OPTIMAL:
-            rota_dict = {
-                (n, d, s) for (n, d, s) in self.shifts
-                if solver.Value(self.shifts[(n, d, s)]) == 1
-            }
-            self.solution = pd.DataFrame(
-                rota_dict, columns=['Nurse', 'Day', 'Shift']
-            ).sort_values(by=['Nurse'])
-
-            roster_path = os.path.join(os.path.dirname(__file__), 'Results/')
-            rota = self.solution.pivot(index='Day', columns='Shift',
-                                       values='Nurse')
-            rota.columns = list(self.daily_shifts.values())
+        if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            solution_values = np.array(solver.ResponseProto().solution)
+            var_indices = np.vectorize(cp_model.IntVar.Index,
+                                       otypes=[np.int64])
+            nurse_ids = np.array(self.nurse_ids)
+
+            nurse_idx, day_idx, shift_idx = np.nonzero(
+                solution_values[var_indices(self.shifts_arr)])
+            self.solution = pd.DataFrame({
+                'Nurse': pd.Categorical.from_codes(
+                    nurse_idx, categories=self.nurse_ids),
+                'Day': day_idx,
+                'Shift': np.array(self.shift_ids)[shift_idx]
+            })
+
+            roster_path = os.path.join(_HERE, 'Results/')
+            os.makedirs(roster_path, exist_ok=True)
+            rota = np.empty((self.num_days, len(self.shift_ids)),
+                            dtype=object)
+            rota[day_idx, shift_idx] = nurse_ids[nurse_idx]
+            rota = pd.DataFrame(rota,
+                                index=pd.RangeIndex(self.num_days, name='Day'),
+                                columns=list(self.daily_shifts.values()))
             df_to_csv(rota, roster_path, 'Complete Rota', index=True)
 
-            rests_dict = {
-                (n, d) for (n, d) in self.rest_days
-                if solver.Value(self.rest_days[(n, d)]) == 1
-            }
+            rest_indices = np.fromiter(
+                (rest_day.Index() for rest_day in self.rest_days.values()),
+                dtype=np.int64, count=len(self.rest_days))
+            rested = solution_values[rest_indices] == 1
             self.assigned_rests = pd.DataFrame(
-                rests_dict, columns=['Nurse', 'Day']
-            ).sort_values(by=['Day'])
+                [key for key, is_rest in zip(self.rest_days, rested)
+                 if is_rest],
+                columns=['Nurse', 'Day'])
 
-            self.solution['Weekend'] = self.solution['Day'].apply(
-                lambda x: what_day(x, self.start_day)[1])
+            self.solution['Weekend'] = \
+                self.weekend_mask[self.solution['Day'].to_numpy()]
 
         else:
             print('ERROR: no solution')
@@ -149,57 +206,62 @@ class NurseSchedulingModel:
 
     def generate_reports(self):
         get_stats = RosterStatistics
-        stats_path = os.path.join(os.path.dirname(__file__),
-                                  'Results/Statistics Breakdown/')
+        stats_path = os.path.join(_HERE, 'Results/Statistics Breakdown/')
+        os.makedirs(stats_path, exist_ok=True)
 
-        nurses_schedules = self.create_schedules_per_nurse()
+        self.create_schedules_per_nurse()
 
-        shift_day_sum = get_stats.calculate_shift_summary(self.solution)
-        df_to_csv(shift_day_sum, stats_path,
-                  'Distribution of Weekday-Weekend Shifts per Nurse')
+        with ThreadPoolExecutor(max_workers=_IO_WORKERS) as pool:
+            shift_day_sum = get_stats.calculate_shift_summary(self.solution)
+            pool.submit(df_to_csv, shift_day_sum, stats_path,
+                        'Distribution of Weekday-Weekend Shifts per Nurse')
 
-        shift_type_sum = get_stats.calculate_shift_types(self.solution,
-                                                         self.daily_shifts)
-        df_to_csv(shift_type_sum, stats_path,
-                  'Distribution of Shift Types per Nurse')
+            shift_type_sum = get_stats.calculate_shift_types(
+                self.solution, self.daily_shifts)
+            pool.submit(df_to_csv, shift_type_sum, stats_path,
+                        'Distribution of Shift Types per Nurse')
 
-        team_dist = get_stats.calculate_team_distribution(self.solution,
-                                                          self.nurses)
-        df_to_csv(team_dist, stats_path,
-                  'Distribution of Shifts per Team')
+            team_dist = get_stats.calculate_team_distribution(self.solution,
+                                                              self.nurses)
+            pool.submit(df_to_csv, team_dist, stats_path,
+                        'Distribution of Shifts per Team')
 
-        weekly_spread = get_stats.calculate_weekly_shifts(self.solution,
-                                                          nurses_schedules)
-        df_to_csv(weekly_spread, stats_path,
-                  'Distribution of Shifts per Week per Nurse')
+            weekly_spread = get_stats.calculate_weekly_shifts(self.solution)
+            pool.submit(df_to_csv, weekly_spread, stats_path,
+                        'Distribution of Shifts per Week per Nurse')
 
     def create_schedules_per_nurse(self) -> dict[int, pd.DataFrame]:
         self.nurse_schedules = {}
-        rosters_path = os.path.join(os.path.dirname(__file__),
-                                    'Results/Rosters/')
-
-        for nurse in self.nurses['Nurse']:
-            schedule = pd.DataFrame({
-                'Day': range(self.num_days),
-                'Day Name': [
-                    what_day(day, start_day=self.start_day)[0]
-                    for day in range(self.num_days)
-                ],
-                'Shift': '--'
-            })
-
-            assigned_shifts = self.solution[
-                self.solution['Nurse'] == nurse].drop('Weekend', axis=1)
-            for row in assigned_shifts.itertuples():
-                schedule.loc[row.Day, 'Shift'] = self.daily_shifts[row.Shift]
-
-            assigned_rests = self.assigned_rests[
-                self.assigned_rests['Nurse'] == nurse]
-            for row in assigned_rests.itertuples():
-                schedule.loc[row.Day, 'Shift'] = 'Rest Day'
-
-            self.nurse_schedules[nurse] = schedule
-            df_to_csv(schedule, rosters_path, f'Nurse {nurse}')
+        rosters_path = os.path.join(_HERE, 'Results/Rosters/')
+        os.makedirs(rosters_path, exist_ok=True)
+
+        assigned_shifts = self.solution.assign(
+            Shift=self.solution['Shift'].map(self.daily_shifts)
+        ).pivot(index='Day', columns='Nurse', values='Shift')
+        assigned_rests = self.assigned_rests.assign(
+            Shift='Rest Day'
+        ).pivot(index='Day', columns='Nurse', values='Shift')
+        shift_names = pd.CategoricalDtype(
+            ['--', 'Rest Day', *self.daily_shifts.values()])
+        shifts_per_nurse = assigned_rests.combine_first(
+            assigned_shifts
+        ).reindex(index=self.all_days, columns=self.nurse_ids).fillna(
+            '--').astype(shift_names)
+
+        day_names = pd.Categorical(
+            [day_name for day_name, _ in self.day_info],
+            categories=DAYS_OF_WEEK, ordered=True)
+        with ThreadPoolExecutor(max_workers=_IO_WORKERS) as pool:
+            for nurse in self.nurse_ids:
+                schedule = pd.DataFrame({
+                    'Day': self.all_days,
+                    'Day Name': day_names,
+                    'Shift': shifts_per_nurse[nurse].array
+                })
+
+                self.nurse_schedules[nurse] = schedule
+                pool.submit(df_to_csv, schedule, rosters_path,
+                            f'Nurse {nurse}')
 
         return self.nurse_schedules
 
@@ -208,44 +270,26 @@ class RosterStatistics:
     @staticmethod
     def calculate_shift_summary(solution: pd.DataFrame,
                                 ) -> pd.DataFrame:
-        shift_summary = pd.DataFrame({
-            'Nurse': solution['Nurse'].unique(),
-            'Weekday Shifts': 0,
-            'Weekend Shifts': 0,
-            'Total Shifts': 0
-        })
-
-        shift_summary['Weekday Shifts'] = \
-            solution[solution['Weekend'] == False
-                     ].groupby('Nurse')['Shift'].count()
-
-        shift_summary['Weekend Shifts'] = \
-            solution[solution['Weekend'] == True
-                     ].groupby('Nurse')['Shift'].count()
+        shift_summary = pd.crosstab(
+            solution['Nurse'], solution['Weekend']
+        ).reindex(columns=[False, True], fill_value=0)
+        shift_summary.columns = ['Weekday Shifts', 'Weekend Shifts']
 
-        shift_summary['Total Shifts'] = \
-            shift_summary[['Weekday Shifts', 'Weekend Shifts']].sum(axis=1)
+        shift_summary['Total Shifts'] = shift_summary.sum(axis=1)
+        shift_summary = shift_summary.reset_index()
 
         return shift_summary
 
     @staticmethod
     def calculate_shift_types(solution: pd.DataFrame,
                               shift_types: dict) -> pd.DataFrame:
-        shift_type_summary = pd.DataFrame({
-            'Nurse': solution['Nurse'].unique(),
-        })
+        shift_type_summary = pd.crosstab(
+            solution['Nurse'], solution['Shift']
+        ).reindex(columns=list(shift_types), fill_value=0)
+        shift_type_summary.columns = list(shift_types.values())
 
-        for shift_id, shift_name in shift_types.items():
-            shift_type_summary[shift_name] = 0
-        shift_type_summary['Total Shifts'] = 0
-
-        for shift_id, shift_name in shift_types.items():
-            shift_type_summary[shift_name] = solution[
-                solution['Shift'] == shift_id
-                ].groupby('Nurse')['Shift'].count()
-
-        shift_type_summary['Total Shifts'] = shift_type_summary[
-            shift_types.values()].sum(axis=1)
+        shift_type_summary['Total Shifts'] = shift_type_summary.sum(axis=1)
+        shift_type_summary = shift_type_summary.reset_index()
 
         return shift_type_summary
 
@@ -268,30 +312,14 @@ class RosterStatistics:
         return team_distribution
 
     @staticmethod
-    def calculate_weekly_shifts(solution: pd.DataFrame,
-                                nurses_schedules: dict[int, pd.DataFrame],
-                                ) -> pd.DataFrame:
-        days = len(nurses_schedules[0])
-        weeks = [(week_start, min(week_start + 7, days))
-                 for week_start in range(0, days, 7)]
-
-        weekly_shifts = pd.DataFrame({
-            'Nurse': solution['Nurse'].unique(),
-        })
-        for week_num in range(len(weeks)):
-            weekly_shifts[f'Week {week_num}'] = 0
-
-        for nurse, schedule in nurses_schedules.items():
-            for week_num, week in enumerate(weeks):
-                week_days = [x for x in range(week[0], week[1])]
-
-                shifts = schedule.iloc[[day for day in week_days]]['Shift']
-                working = shifts[~shifts.isin(['--', 'Rest Day'])].count()
-
-                weekly_shifts.loc[weekly_shifts['Nurse'] == nurse,
-                                  f'Week {week_num}'] = working
-
-        weekly_shifts['Total Shifts'] = weekly_shifts.filter(
-            like='Week').sum(axis=1)
+    def calculate_weekly_shifts(solution: pd.DataFrame) -> pd.DataFrame:
+        weeks = solution['Day'] // 7
+        weekly_shifts = pd.crosstab(solution['Nurse'], weeks).reindex(
+            columns=range(weeks.max() + 1), fill_value=0
+        ).add_prefix('Week ')
+        weekly_shifts.columns.name = None
+
+        weekly_shifts['Total Shifts'] = weekly_shifts.sum(axis=1)
+        weekly_shifts = weekly_shifts.reset_index()
 
         return weekly_shifts
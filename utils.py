@@ -2,13 +2,16 @@ import os
 import pandas as pd
 
 
+DAYS_OF_WEEK = ('Monday', 'Tuesday', 'Wednesday', 'Thursday',
+                'Friday', 'Saturday', 'Sunday')
+_DAY_INDEX = {day_name: index for index, day_name in enumerate(DAYS_OF_WEEK)}
+_IS_WEEKEND = (False,) * 5 + (True,) * 2
+
+
 def what_day(day: int, start_day: str) -> tuple[str, bool]:
-    days_of_week = ['Monday', 'Tuesday', 'Wednesday', 'Thursday',
-                    'Friday', 'Saturday', 'Sunday']
-    day_index = (days_of_week.index(start_day) + day) % 7
-    is_weekend = day_index >= 5
+    day_index = (_DAY_INDEX[start_day] + day) % 7
 
-    return days_of_week[day_index], is_weekend
+    return DAYS_OF_WEEK[day_index], _IS_WEEKEND[day_index]
 
 
 def csv_to_df(csv_file_path: str) -> pd.DataFrame:
@@ -26,7 +29,6 @@ def csv_to_df(csv_file_path: str) -> pd.DataFrame:
 
 def df_to_csv(df: pd.DataFrame, dir_path: str, file_name: str,
               index: bool = False) -> None:
-    os.makedirs(dir_path, exist_ok=True)
     csv_file_path = os.path.join(dir_path, f'{file_name}.csv')
     try:
         df.to_csv(csv_file_path, index=index)